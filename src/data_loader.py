@@ -3,36 +3,111 @@ Data Loader Module
 Loads BTC transactions and Fear & Greed Index, merges them by date
 """
 
+import shutil
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import csv as pa_csv
 from pathlib import Path
 from datetime import datetime, timedelta
 
+# Explicit Arrow types for the transaction columns we compute on, so the
+# CSV parser casts them natively instead of a pd.to_numeric pass per column
+TRANSACTION_COLUMN_TYPES = {
+    'Execution Price': pa.float64(),
+    'Size Tokens': pa.float64(),
+    'Size USD': pa.float64(),
+    'Closed PnL': pa.float64(),
+    'Fee': pa.float64(),
+    'Coin': pa.string(),
+    'Direction': pa.string(),
+    'Side': pa.string(),
+    'Timestamp IST': pa.string(),
+}
+
+# Fear & Greed classifications, least to most greedy, and the score
+# edges of the matching sentiment ranges
+SENTIMENT_CLASSES = ['Extreme Fear', 'Fear', 'Neutral', 'Greed', 'Extreme Greed']
+SENTIMENT_BINS = [0, 20, 40, 60, 80, 100]
+
+# Written into the partitioned dataset once an ingest completes; its mtime marks
+# the CSV version the dataset was built from ('_' files are skipped by dataset reads)
+INGEST_MARKER = '_SUCCESS'
+
+# Bit positions of the packed per-trade 'flags' column
+FLAG_WIN = 1
+FLAG_LOSS = 2
+FLAG_LONG = 4
+FLAG_SHORT = 8
+
+
+def bin_sentiment_scores(scores):
+    """Bin 0-100 sentiment scores into SENTIMENT_CLASSES, matching
+    pd.cut(bins=SENTIMENT_BINS, include_lowest=True)"""
+    scores = np.asarray(scores, dtype=np.float64)
+    # Bins are right-closed, so a score on an inner edge belongs to the lower bin
+    codes = np.searchsorted(SENTIMENT_BINS[1:-1], scores, side='left')
+    codes[~((scores >= SENTIMENT_BINS[0]) & (scores <= SENTIMENT_BINS[-1]))] = -1
+    return pd.Categorical.from_codes(codes, categories=SENTIMENT_CLASSES, ordered=True)
+
+
 class DataLoader:
     def __init__(self, data_dir='datasets'):
         self.data_dir = Path(data_dir)
         self.historical_path = self.data_dir / 'historical_data.csv'
+        self.historical_dataset_dir = self.data_dir / 'historical_data'
         self.sentiment_path = self.data_dir / 'fear_greed_index.csv'
         
+    def ingest_historical_data(self):
+        """Convert the transaction CSV into a Parquet dataset partitioned by Coin"""
+        print("Ingesting transaction data...")
+        table = pa_csv.read_csv(
+            self.historical_path,
+            read_options=pa_csv.ReadOptions(use_threads=True),
+            convert_options=pa_csv.ConvertOptions(column_types=TRANSACTION_COLUMN_TYPES)
+        )
+        
+        # Build the dataset beside the live one and swap it in only once complete,
+        # so an interrupted ingest never leaves a partial dataset behind
+        staging_dir = self.historical_dataset_dir.with_name(self.historical_dataset_dir.name + '.tmp')
+        retired_dir = self.historical_dataset_dir.with_name(self.historical_dataset_dir.name + '.old')
+        for leftover in (staging_dir, retired_dir):
+            shutil.rmtree(leftover, ignore_errors=True)
+        try:
+            # Single-threaded write keeps each partition in the original row order
+            pq.write_to_dataset(table, staging_dir, partition_cols=['Coin'], use_threads=False)
+            (staging_dir / INGEST_MARKER).touch()
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        
+        if self.historical_dataset_dir.exists():
+            self.historical_dataset_dir.rename(retired_dir)
+        staging_dir.rename(self.historical_dataset_dir)
+        shutil.rmtree(retired_dir, ignore_errors=True)
+        print(f"✓ Wrote {table.num_rows:,} transactions to: {self.historical_dataset_dir}")
+    
     def load_btc_transactions(self):
         """Load and filter BTC transactions"""
-        print("Loading transaction data...")
-        df = pd.read_csv(self.historical_path)
+        # (Re)build the partitioned dataset when missing, incomplete or older than the CSV
+        marker = self.historical_dataset_dir / INGEST_MARKER
+        if not marker.exists() or self.historical_path.stat().st_mtime > marker.stat().st_mtime:
+            self.ingest_historical_data()
         
-        # Filter for BTC transactions only
-        btc_df = df[df['Coin'] == 'BTC'].copy()
-        print(f"Found {len(btc_df):,} BTC transactions out of {len(df):,} total")
+        print("Loading transaction data...")
+        dataset = ds.dataset(self.historical_dataset_dir, format='parquet', partitioning='hive')
         
-        # Parse timestamp
-        btc_df['Timestamp IST'] = pd.to_datetime(btc_df['Timestamp IST'], format='%d-%m-%Y %H:%M')
-        btc_df['date'] = btc_df['Timestamp IST'].dt.date
+        # Filter for BTC transactions only (prunes every other Coin= partition unread)
+        btc_df = dataset.to_table(filter=ds.field('Coin') == 'BTC').to_pandas()
+        print(f"Found {len(btc_df):,} BTC transactions out of {dataset.count_rows():,} total")
         
-        # Convert to appropriate types
-        btc_df['Execution Price'] = pd.to_numeric(btc_df['Execution Price'], errors='coerce')
-        btc_df['Size Tokens'] = pd.to_numeric(btc_df['Size Tokens'], errors='coerce')
-        btc_df['Size USD'] = pd.to_numeric(btc_df['Size USD'], errors='coerce')
-        btc_df['Closed PnL'] = pd.to_numeric(btc_df['Closed PnL'], errors='coerce')
-        btc_df['Fee'] = pd.to_numeric(btc_df['Fee'], errors='coerce')
+        # Parse timestamp (cache=True parses each distinct timestamp string once)
+        btc_df['Timestamp IST'] = pd.to_datetime(btc_df['Timestamp IST'], format='%d-%m-%Y %H:%M',
+                                                 cache=True, exact=True)
+        # Keep the trading day as datetime64 (not datetime.date objects) for fast merges/groupbys
+        btc_df['date'] = btc_df['Timestamp IST'].values.astype('datetime64[D]')
         
         return btc_df
     
@@ -41,10 +116,10 @@ class DataLoader:
         print("Loading sentiment data...")
         df = pd.read_csv(self.sentiment_path)
         
-        # Parse date
-        df['date'] = pd.to_datetime(df['date']).dt.date
+        # Parse date (same datetime64 day resolution as the transactions)
+        df['date'] = pd.to_datetime(df['date']).values.astype('datetime64[D]')
         
-        print(f"Loaded {len(df):,} sentiment records from {df['date'].min()} to {df['date'].max()}")
+        print(f"Loaded {len(df):,} sentiment records from {df['date'].min():%Y-%m-%d} to {df['date'].max():%Y-%m-%d}")
         
         return df
     
@@ -59,12 +134,21 @@ class DataLoader:
         btc_df['is_win'] = btc_df['net_pnl'] > 0
         btc_df['is_loss'] = btc_df['net_pnl'] < 0
         
-        # Trade direction
-        btc_df['is_long'] = btc_df['Direction'].str.contains('Long', case=False, na=False)
-        btc_df['is_short'] = btc_df['Direction'].str.contains('Short', case=False, na=False)
+        # Trade direction: match the substrings once per distinct Direction value, not per row.
+        # Flips ('Long > Short', 'Short > Long') contain both and count on both sides.
+        btc_df['Direction'] = btc_df['Direction'].astype('category')
+        directions = btc_df['Direction'].cat.categories
+        btc_df['is_long'] = btc_df['Direction'].isin(directions[directions.str.contains('Long', case=False)])
+        btc_df['is_short'] = btc_df['Direction'].isin(directions[directions.str.contains('Short', case=False)])
+        
+        # All four trade flags packed into one uint8 bitfield
+        btc_df['flags'] = (btc_df['is_win'].to_numpy().astype(np.uint8) * FLAG_WIN
+                           | btc_df['is_loss'].to_numpy().astype(np.uint8) * FLAG_LOSS
+                           | btc_df['is_long'].to_numpy().astype(np.uint8) * FLAG_LONG
+                           | btc_df['is_short'].to_numpy().astype(np.uint8) * FLAG_SHORT)
         
         # Position type
-        btc_df['action_type'] = btc_df['Side'].str.upper()
+        btc_df['action_type'] = btc_df['Side'].str.upper().astype('category')
         
         return btc_df
     
@@ -72,12 +156,27 @@ class DataLoader:
         """Merge transactions with sentiment data"""
         print("Merging with sentiment data...")
         
+        # One sentiment reading per day, with gaps in the index filled once
+        # on the small daily frame rather than per transaction row
+        sentiment = (sentiment_df[['date', 'value', 'classification']]
+                     .drop_duplicates('date')
+                     .sort_values('date')
+                     .ffill()
+                     .bfill())
+        
         # Merge on date
-        merged_df = btc_df.merge(
-            sentiment_df[['date', 'value', 'classification']], 
-            on='date', 
-            how='left'
-        )
+        merged_df = btc_df.merge(sentiment, on='date', how='left')
+        
+        # Trading days absent from the index take the nearest day's reading
+        missing = merged_df['value'].isna()
+        if missing.any():
+            nearest = pd.merge_asof(
+                merged_df.loc[missing, ['date']].reset_index().sort_values('date'),
+                sentiment,
+                on='date',
+                direction='nearest'
+            ).set_index('index')
+            merged_df.loc[missing, ['value', 'classification']] = nearest[['value', 'classification']]
         
         # Rename sentiment columns for clarity
         merged_df.rename(columns={
@@ -85,12 +184,18 @@ class DataLoader:
             'classification': 'sentiment_class'
         }, inplace=True)
         
-        # Fill missing sentiment with forward fill then backward fill
-        merged_df['sentiment_score'] = merged_df.groupby('date')['sentiment_score'].ffill().bfill()
-        merged_df['sentiment_class'] = merged_df.groupby('date')['sentiment_class'].ffill().bfill()
+        # Categorical keys make every downstream groupby work on small integer codes
+        merged_df['sentiment_class'] = pd.Categorical(
+            merged_df['sentiment_class'], categories=SENTIMENT_CLASSES, ordered=True
+        )
+        
+        # Scores are 0-100 integers, so float32 is exact; bin them once here
+        # rather than in every analysis module
+        merged_df['sentiment_score'] = merged_df['sentiment_score'].astype('float32')
+        merged_df['sentiment_range'] = bin_sentiment_scores(merged_df['sentiment_score'])
         
         print(f"Merged dataset: {len(merged_df):,} transactions")
-        print(f"Date range: {merged_df['date'].min()} to {merged_df['date'].max()}")
+        print(f"Date range: {merged_df['date'].min():%Y-%m-%d} to {merged_df['date'].max():%Y-%m-%d}")
         print(f"Missing sentiment: {merged_df['sentiment_score'].isna().sum()} rows")
         
         return merged_df
@@ -113,8 +218,8 @@ class DataLoader:
         
         # Save if requested
         if save_output:
-            output_path = self.data_dir / 'merged_btc_sentiment.csv'
-            merged_df.to_csv(output_path, index=False)
+            output_path = self.data_dir / 'merged_btc_sentiment.parquet'
+            merged_df.to_parquet(output_path, engine='pyarrow', compression='zstd', index=False)
             print(f"\n✓ Saved merged dataset to: {output_path}")
         
         print("\n" + "=" * 60)
@@ -122,7 +227,7 @@ class DataLoader:
         print("=" * 60)
         print(f"Total BTC transactions: {len(merged_df):,}")
         print(f"Unique trading days: {merged_df['date'].nunique()}")
-        print(f"Date range: {merged_df['date'].min()} to {merged_df['date'].max()}")
+        print(f"Date range: {merged_df['date'].min():%Y-%m-%d} to {merged_df['date'].max():%Y-%m-%d}")
         print(f"\nSentiment Distribution:")
         print(merged_df['sentiment_class'].value_counts())
         print(f"\nTrade Direction:")
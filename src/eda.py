@@ -5,6 +5,8 @@ Creates visualizations and performs statistical tests
 
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # plots are only saved to file, so skip any GUI backend
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
@@ -15,32 +17,52 @@ sns.set_style("whitegrid")
 plt.rcParams['figure.figsize'] = (14, 8)
 plt.rcParams['font.size'] = 10
 
+# Columns of the merged dataset used by this module
+ANALYSIS_COLUMNS = ['date', 'net_pnl', 'is_win', 'is_long', 'is_short',
+                    'sentiment_score', 'sentiment_class', 'sentiment_range', 'Size USD']
+
+# Max rows per category fed to seaborn's box/violin plots
+PLOT_SAMPLE_SIZE = 20_000
+
 class EDAAnalyzer:
-    def __init__(self, data_path='datasets/merged_btc_sentiment.csv', output_dir='notebooks'):
+    def __init__(self, data_path='datasets/merged_btc_sentiment.parquet', output_dir='notebooks'):
         self.data_path = Path(data_path)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         self.df = None
+        self.daily = None
         
     def load_data(self):
         """Load merged dataset"""
         print("Loading data for EDA...")
-        self.df = pd.read_csv(self.data_path)
-        self.df['date'] = pd.to_datetime(self.df['date'])
-        
-        # Add sentiment range
-        bins = [0, 20, 40, 60, 80, 100]
-        labels = ['Extreme Fear', 'Fear', 'Neutral', 'Greed', 'Extreme Greed']
-        self.df['sentiment_range'] = pd.cut(self.df['sentiment_score'], 
-                                             bins=bins, labels=labels, include_lowest=True)
+        self.df = pd.read_parquet(self.data_path, columns=ANALYSIS_COLUMNS)
+        # Position size only feeds plots and the correlation test here, so float32
+        # halves the bytes scanned and lets .to_numpy(np.float32) return a view
+        self.df['Size USD'] = self.df['Size USD'].astype(np.float32)
+        
+        # Daily summary shared by the timeline plots (one groupby pass)
+        self.daily = self.df.groupby('date', sort=True, observed=True).agg(
+            net_pnl=('net_pnl', 'sum'),
+            sentiment_score=('sentiment_score', 'first'),
+            sentiment_class=('sentiment_class', 'first'),
+            trade_count=('net_pnl', 'size')
+        ).reset_index()
+        self.daily['cumulative_pnl'] = self.daily['net_pnl'].cumsum()
         return self.df
     
+    def sample_for_plot(self, by):
+        """Stratified sample with at most PLOT_SAMPLE_SIZE rows per category of `by`"""
+        if self.df[by].value_counts().max() <= PLOT_SAMPLE_SIZE:
+            return self.df
+        shuffled = self.df.sample(frac=1, random_state=0)
+        return shuffled[shuffled.groupby(by, observed=True, sort=False).cumcount() < PLOT_SAMPLE_SIZE]
+    
     def plot_pnl_by_sentiment(self):
         """Box plot of P&L grouped by sentiment"""
         fig, axes = plt.subplots(1, 2, figsize=(16, 6))
         
         # By sentiment class
-        sns.boxplot(data=self.df, x='sentiment_class', y='net_pnl', ax=axes[0])
+        sns.boxplot(data=self.sample_for_plot('sentiment_class'), x='sentiment_class', y='net_pnl', ax=axes[0])
         axes[0].set_title('Net P&L Distribution by Sentiment Class', fontsize=14, fontweight='bold')
         axes[0].set_xlabel('Sentiment Class')
         axes[0].set_ylabel('Net P&L ($)')
@@ -48,7 +70,7 @@ class EDAAnalyzer:
         axes[0].tick_params(axis='x', rotation=45)
         
         # By sentiment range
-        sns.boxplot(data=self.df, x='sentiment_range', y='net_pnl', ax=axes[1])
+        sns.boxplot(data=self.sample_for_plot('sentiment_range'), x='sentiment_range', y='net_pnl', ax=axes[1])
         axes[1].set_title('Net P&L Distribution by Sentiment Range', fontsize=14, fontweight='bold')
         axes[1].set_xlabel('Sentiment Range')
         axes[1].set_ylabel('Net P&L ($)')
@@ -63,11 +85,29 @@ class EDAAnalyzer:
     def plot_win_rate_heatmap(self):
         """Heatmap of win rate by sentiment and trade direction"""
         # Create pivot table
-        self.df['trade_type'] = self.df.apply(
-            lambda x: 'Long' if x['is_long'] else ('Short' if x['is_short'] else 'Unknown'), axis=1
+        self.df['trade_type'] = pd.Categorical.from_codes(
+            np.select([self.df['is_long'].values, self.df['is_short'].values], [0, 1], default=2),
+            categories=['Long', 'Short', 'Unknown']
         )
         
-        pivot = self.df.groupby(['sentiment_range', 'trade_type'])['is_win'].mean().unstack() * 100
+        # Win and trade counts per (range, type) cell straight from the category codes
+        ranges = self.df['sentiment_range'].cat
+        types = self.df['trade_type'].cat
+        n_types = len(types.categories)
+        shape = (len(ranges.categories), n_types)
+        range_codes = ranges.codes.to_numpy().astype(np.int64)
+        valid = range_codes >= 0
+        cell = range_codes[valid] * n_types + types.codes.to_numpy()[valid]
+        wins = np.bincount(cell, weights=self.df['is_win'].to_numpy()[valid], minlength=shape[0] * n_types)
+        trades = np.bincount(cell, minlength=shape[0] * n_types)
+        wins, trades = wins.reshape(shape), trades.reshape(shape)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pivot = pd.DataFrame(100 * wins / trades,
+                                 index=ranges.categories.rename('sentiment_range'),
+                                 columns=types.categories.rename('trade_type'))
+        # Keep only observed ranges / trade types
+        pivot = pivot.loc[trades.sum(axis=1) > 0, trades.sum(axis=0) > 0]
         
         plt.figure(figsize=(10, 6))
         sns.heatmap(pivot, annot=True, fmt='.1f', cmap='RdYlGn', center=50, 
@@ -85,14 +125,14 @@ class EDAAnalyzer:
         fig, axes = plt.subplots(1, 2, figsize=(16, 6))
         
         # Violin plot
-        sns.violinplot(data=self.df, x='sentiment_range', y='Size USD', ax=axes[0])
+        sns.violinplot(data=self.sample_for_plot('sentiment_range'), x='sentiment_range', y='Size USD', ax=axes[0])
         axes[0].set_title('Position Size Distribution by Sentiment', fontsize=14, fontweight='bold')
         axes[0].set_xlabel('Sentiment Range')
         axes[0].set_ylabel('Position Size (USD)')
         axes[0].tick_params(axis='x', rotation=45)
         
         # Average position size
-        avg_size = self.df.groupby('sentiment_range')['Size USD'].mean().sort_values()
+        avg_size = self.df.groupby('sentiment_range', observed=True, sort=False)['Size USD'].mean().sort_values()
         avg_size.plot(kind='barh', ax=axes[1], color='steelblue')
         axes[1].set_title('Average Position Size by Sentiment', fontsize=14, fontweight='bold')
         axes[1].set_xlabel('Average Size (USD)')
@@ -105,13 +145,7 @@ class EDAAnalyzer:
     
     def plot_trade_timeline(self):
         """Trade count timeline with sentiment overlay"""
-        daily_summary = self.df.groupby('date').agg({
-            'net_pnl': 'sum',
-            'sentiment_score': 'first',
-            'sentiment_class': 'first'
-        }).reset_index()
-        
-        daily_summary['trade_count'] = self.df.groupby('date').size().values
+        daily_summary = self.daily
         
         fig, axes = plt.subplots(3, 1, figsize=(16, 12), sharex=True)
         
@@ -136,7 +170,6 @@ class EDAAnalyzer:
         axes[1].grid(True, alpha=0.3)
         
         #Cumulative PnL
-        daily_summary['cumulative_pnl'] = daily_summary['net_pnl'].cumsum()
         axes[2].plot(daily_summary['date'], daily_summary['cumulative_pnl'], 
                      color='darkgreen', linewidth=2, label='Cumulative P&L')
         axes[2].axhline(y=0, color='red', linestyle='--', alpha=0.5)
@@ -157,13 +190,7 @@ class EDAAnalyzer:
     
     def plot_cumulative_pnl_sentiment(self):
         """Cumulative PnL with sentiment phases highlighted"""
-        daily_summary = self.df.groupby('date').agg({
-            'net_pnl': 'sum',
-            'sentiment_score': 'first',
-            'sentiment_class': 'first'
-        }).reset_index().sort_values('date')
-        
-        daily_summary['cumulative_pnl'] = daily_summary['net_pnl'].cumsum()
+        daily_summary = self.daily
         
         fig, ax = plt.subplots(figsize=(16, 8))
         
@@ -180,7 +207,7 @@ class EDAAnalyzer:
             mask = daily_summary['sentiment_class'] == sentiment
             ax.scatter(daily_summary[mask]['date'], 
                       daily_summary[mask]['cumulative_pnl'],
-                      c=color, label=sentiment, s=50, alpha=0.6)
+                      c=color, label=sentiment, s=50, alpha=0.6, rasterized=True)
         
         ax.plot(daily_summary['date'], daily_summary['cumulative_pnl'], 
                 color='black', linewidth=1.5, alpha=0.5, zorder=0)
@@ -204,7 +231,13 @@ class EDAAnalyzer:
         
         # ANOVA: PnL across sentiment groups
         print("\n1. ANOVA: Net P&L differences across sentiment classes")
-        sentiment_groups = [group['net_pnl'].values for name, group in self.df.groupby('sentiment_class')]
+        # Sort P&L by class code once and slice each class as a contiguous view;
+        # rows with a missing class (code -1) sort first and are dropped
+        codes = self.df['sentiment_class'].cat.codes.to_numpy()
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(self.df['sentiment_class'].cat.categories)))
+        segments = np.split(self.df['net_pnl'].to_numpy()[order], bounds)[1:]
+        sentiment_groups = [group for group in segments if group.size]
         f_stat, p_value = stats.f_oneway(*sentiment_groups)
         print(f"   F-statistic: {f_stat:.4f}")
         print(f"   P-value: {p_value:.6f}")
@@ -212,7 +245,15 @@ class EDAAnalyzer:
         
         # Chi-square: Trade direction independence from sentiment
         print("\n2. Chi-Square: Trade direction independence from sentiment")
-        contingency = pd.crosstab(self.df['sentiment_class'], self.df['trade_type'])
+        sent_codes = self.df['sentiment_class'].cat.codes.to_numpy().astype(np.int64)
+        trade_codes = self.df['trade_type'].cat.codes.to_numpy()
+        n_sent = len(self.df['sentiment_class'].cat.categories)
+        n_trade = len(self.df['trade_type'].cat.categories)
+        valid = sent_codes >= 0
+        contingency = np.bincount(sent_codes[valid] * n_trade + trade_codes[valid],
+                                  minlength=n_sent * n_trade).reshape(n_sent, n_trade)
+        # Drop unobserved classes / trade types, as pd.crosstab does
+        contingency = contingency[contingency.sum(axis=1) > 0][:, contingency.sum(axis=0) > 0]
         chi2, p_value, dof, expected = stats.chi2_contingency(contingency)
         print(f"   Chi-square: {chi2:.4f}")
         print(f"   P-value: {p_value:.6f}")
@@ -220,7 +261,8 @@ class EDAAnalyzer:
         
         # Correlation: Position size vs sentiment score
         print("\n3. Correlation: Position size vs sentiment score")
-        corr, p_value = stats.pearsonr(self.df['Size USD'], self.df['sentiment_score'])
+        corr, p_value = stats.pearsonr(self.df['Size USD'].to_numpy(dtype=np.float32, copy=False),
+                                       self.df['sentiment_score'].to_numpy(dtype=np.float32, copy=False))
         print(f"   Pearson correlation: {corr:.4f}")
         print(f"   P-value: {p_value:.6f}")
         print(f"   Result: {'Significant' if p_value < 0.05 else 'No significant'} correlation")
@@ -5,24 +5,110 @@ Generates actionable trading insights from sentiment analysis
 
 import pandas as pd
 import numpy as np
+import numba
+from numba import njit, prange
 from pathlib import Path
 
+# Bit positions of the packed 'flags' column, as written by the data loader
+try:
+    from .data_loader import FLAG_WIN, FLAG_LOSS, FLAG_LONG, FLAG_SHORT
+except ImportError:  # run as a script from src/
+    from data_loader import FLAG_WIN, FLAG_LOSS, FLAG_LONG, FLAG_SHORT
+
+# Columns of the merged dataset used by this module; win/loss/direction are read
+# from the one-byte 'flags' column rather than four bool columns
+ANALYSIS_COLUMNS = ['net_pnl', 'flags', 'sentiment_range', 'Size USD']
+
+
+@njit(parallel=True, cache=True)
+def _sentiment_bin_stats(codes, pnl, flags, size, n_bins, n_chunks):
+    """Per-bin trade statistics in one parallel pass (plus one for the size variance);
+    missing P&L and size values are skipped, each with its own count"""
+    n = codes.size
+    chunk = (n + n_chunks - 1) // n_chunks
+    
+    # Per-chunk accumulators, reduced after the parallel loop
+    # columns: trades, pnl, wins, longs, shorts, long wins, short wins, losses, loss pnl, size,
+    #          pnl count, size count
+    acc = np.zeros((n_chunks, n_bins, 12))
+    for t in prange(n_chunks):
+        for i in range(t * chunk, min(n, (t + 1) * chunk)):
+            c = codes[i]
+            if c < 0:
+                continue
+            f = flags[i]
+            win = (f & FLAG_WIN) != 0
+            is_long = (f & FLAG_LONG) != 0
+            is_short = (f & FLAG_SHORT) != 0
+            acc[t, c, 0] += 1
+            if not np.isnan(pnl[i]):
+                acc[t, c, 1] += pnl[i]
+                acc[t, c, 10] += 1
+            acc[t, c, 2] += win
+            acc[t, c, 3] += is_long
+            acc[t, c, 4] += is_short
+            acc[t, c, 5] += win and is_long
+            acc[t, c, 6] += win and is_short
+            if f & FLAG_LOSS:
+                acc[t, c, 7] += 1
+                acc[t, c, 8] += pnl[i]
+            if not np.isnan(size[i]):
+                acc[t, c, 9] += size[i]
+                acc[t, c, 11] += 1
+    totals = acc.sum(axis=0)
+    
+    # Centered second pass keeps the size variance accurate for large positions
+    size_mean = totals[:, 9] / np.maximum(totals[:, 11], 1)
+    sq = np.zeros((n_chunks, n_bins))
+    for t in prange(n_chunks):
+        for i in range(t * chunk, min(n, (t + 1) * chunk)):
+            c = codes[i]
+            if c < 0 or np.isnan(size[i]):
+                continue
+            d = size[i] - size_mean[c]
+            sq[t, c] += d * d
+    return totals, sq.sum(axis=0)
+
+
 class InsightsGenerator:
-    def __init__(self, data_path='datasets/merged_btc_sentiment.csv'):
+    def __init__(self, data_path='datasets/merged_btc_sentiment.parquet'):
         self.data_path = Path(data_path)
         self.df = None
+        self.by_sentiment = None
         self.insights = []
         
     def load_data(self):
         """Load merged dataset"""
-        self.df = pd.read_csv(self.data_path)
-        self.df['date'] = pd.to_datetime(self.df['date'])
-        
-        # Add sentiment range
-        bins = [0, 20, 40, 60, 80, 100]
-        labels = ['Extreme Fear', 'Fear', 'Neutral', 'Greed', 'Extreme Greed']
-        self.df['sentiment_range'] = pd.cut(self.df['sentiment_score'], 
-                                             bins=bins, labels=labels, include_lowest=True)
+        self.df = pd.read_parquet(self.data_path, columns=ANALYSIS_COLUMNS)
+        
+        # Per-sentiment statistics shared by all insight methods (one fused pass)
+        ranges = self.df['sentiment_range']
+        totals, size_sq = _sentiment_bin_stats(
+            ranges.cat.codes.to_numpy(),
+            self.df['net_pnl'].to_numpy(dtype=np.float64),
+            self.df['flags'].to_numpy(),
+            self.df['Size USD'].to_numpy(dtype=np.float64),
+            len(ranges.cat.categories),
+            numba.get_num_threads()
+        )
+        (trades, pnl_sum, wins, longs, shorts, long_wins, short_wins, losses, loss_sum, size_sum,
+         pnl_count, size_count) = totals.T
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            by_sentiment = pd.DataFrame({
+                'Total_PnL': pnl_sum,
+                'Avg_PnL': pnl_sum / pnl_count,
+                'Trades': trades.astype(np.int64),
+                'Win_Rate': wins / trades,
+                'Avg_Size': size_sum / size_count,
+                'Size_Std': np.sqrt(size_sq / (size_count - 1)),
+                'Long_Ratio': longs / trades,
+                'Avg_Loss': loss_sum / losses,
+                'Long_Win_Rate': long_wins / longs,
+                'Short_Win_Rate': short_wins / shorts
+            }, index=ranges.cat.categories.rename('sentiment_range'))
+        by_sentiment.loc[size_count < 2, 'Size_Std'] = np.nan
+        self.by_sentiment = by_sentiment[trades > 0]
         return self.df
     
     def identify_optimal_conditions(self):
@@ -32,13 +118,7 @@ class InsightsGenerator:
         print("=" * 60)
         
         # Performance by sentiment range
-        perf = self.df.groupby('sentiment_range').agg({
-            'net_pnl': ['sum', 'mean', 'count'],
-            'is_win': 'mean',
-            'Size USD': 'mean'
-        }).round(4)
-        
-        perf.columns = ['Total_PnL', 'Avg_PnL', 'Trades', 'Win_Rate', 'Avg_Size']
+        perf = self.by_sentiment
         
         best_sentiment = perf['Win_Rate'].idxmax()
         best_win_rate = perf.loc[best_sentiment, 'Win_Rate'] * 100
@@ -70,27 +150,26 @@ class InsightsGenerator:
         print("=" * 60)
         
         # Extreme sentiment analysis
-        extreme_fear = self.df[self.df['sentiment_range'] == 'Extreme Fear']
-        extreme_greed = self.df[self.df['sentiment_range'] == 'Extreme Greed']
+        perf = self.by_sentiment
         
-        if len(extreme_fear) > 0:
-            fear_win_rate = extreme_fear['is_win'].mean() * 100
-            fear_avg_loss = extreme_fear[extreme_fear['net_pnl'] < 0]['net_pnl'].mean()
+        if 'Extreme Fear' in perf.index:
+            fear_win_rate = perf.loc['Extreme Fear', 'Win_Rate'] * 100
+            fear_avg_loss = perf.loc['Extreme Fear', 'Avg_Loss']
             
             insight = f"✗ Extreme Fear: {fear_win_rate:.1f}% win rate, average loss ${fear_avg_loss:,.2f}"
             print(insight)
             self.insights.append(insight)
         
-        if len(extreme_greed) > 0:
-            greed_win_rate = extreme_greed['is_win'].mean() * 100
-            greed_avg_loss = extreme_greed[extreme_greed['net_pnl'] < 0]['net_pnl'].mean()
+        if 'Extreme Greed' in perf.index:
+            greed_win_rate = perf.loc['Extreme Greed', 'Win_Rate'] * 100
+            greed_avg_loss = perf.loc['Extreme Greed', 'Avg_Loss']
             
             insight = f"✗ Extreme Greed: {greed_win_rate:.1f}% win rate, average loss ${greed_avg_loss:,.2f}"
             print(insight)
             self.insights.append(insight)
         
         # Volatility in position sizing
-        size_volatility = self.df.groupby('sentiment_range')['Size USD'].std()
+        size_volatility = perf['Size_Std']
         highest_volatility = size_volatility.idxmax()
         
         insight = f"✗ Highest position size volatility during {highest_volatility} (${ size_volatility.max():,.2f} std)"
@@ -104,7 +183,7 @@ class InsightsGenerator:
         print("=" * 60)
         
         # Position sizing bias
-        avg_size_by_sentiment = self.df.groupby('sentiment_range')['Size USD'].mean()
+        avg_size_by_sentiment = self.by_sentiment['Avg_Size']
         max_size_sentiment = avg_size_by_sentiment.idxmax()
         min_size_sentiment = avg_size_by_sentiment.idxmin()
         size_ratio = avg_size_by_sentiment.max() / avg_size_by_sentiment.min()
@@ -114,11 +193,13 @@ class InsightsGenerator:
         self.insights.append(insight)
         
         # Trade direction bias
-        self.df['trade_type'] = self.df.apply(
-            lambda x: 'Long' if x['is_long'] else ('Short' if x['is_short'] else 'Unknown'), axis=1
+        flags = self.df['flags'].to_numpy()
+        self.df['trade_type'] = pd.Categorical.from_codes(
+            np.select([(flags & FLAG_LONG) != 0, (flags & FLAG_SHORT) != 0], [0, 1], default=2),
+            categories=['Long', 'Short', 'Unknown']
         )
         
-        long_ratio = self.df.groupby('sentiment_range')['is_long'].mean() * 100
+        long_ratio = self.by_sentiment['Long_Ratio'] * 100
         
         for sentiment, ratio in long_ratio.items():
             if ratio > 70:
@@ -131,7 +212,7 @@ class InsightsGenerator:
                 self.insights.append(insight)
         
         # Overtrading detection
-        trade_freq = self.df.groupby('sentiment_range').size()
+        trade_freq = self.by_sentiment['Trades']
         if trade_freq.max() / trade_freq.min() > 2:
             max_freq_sentiment = trade_freq.idxmax()
             insight = f"⚡ Overtrading Alert: {trade_freq.max()} trades during {max_freq_sentiment} vs {trade_freq.min()} in quietest period"
@@ -145,13 +226,7 @@ class InsightsGenerator:
         print("=" * 60)
         
         # Analyze performance to create rules
-        perf = self.df.groupby('sentiment_range').agg({
-            'is_win': 'mean',
-            'net_pnl': ['mean', 'sum'],
-            'Size USD': 'mean'
-        })
-        
-        perf.columns = ['Win_Rate', 'Avg_PnL', 'Total_PnL', 'Avg_Size']
+        perf = self.by_sentiment
         
         # Rule 1: High win rate conditions
         high_wr = perf[perf['Win_Rate'] > 0.55].index.tolist()
@@ -176,8 +251,8 @@ class InsightsGenerator:
         self.insights.append(rule)
         
         # Rule 4: Trade direction
-        long_performance = self.df[self.df['is_long']].groupby('sentiment_range')['is_win'].mean()
-        short_performance = self.df[self.df['is_short']].groupby('sentiment_range')['is_win'].mean()
+        long_performance = perf['Long_Win_Rate'].dropna()
+        short_performance = perf['Short_Win_Rate'].dropna()
         
         for sentiment in long_performance.index:
             if sentiment in short_performance.index:
@@ -198,7 +273,7 @@ class InsightsGenerator:
         
         total_trades = len(self.df)
         total_pnl = self.df['net_pnl'].sum()
-        overall_wr = self.df['is_win'].mean() * 100
+        overall_wr = ((self.df['flags'].to_numpy() & FLAG_WIN) != 0).mean() * 100
         
         print(f"\nOVERALL PERFORMANCE:")
         print(f"  Total Trades: {total_trades:,}")
@@ -3,59 +3,337 @@ Trader Analysis Module
 Analyzes trader performance across different sentiment conditions
 """
 
+import warnings
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import numba
+from numba import njit, prange
 from pathlib import Path
 
+# Sentiment classes and binning are shared with the data loader, so both paths bin alike
+try:
+    from .data_loader import SENTIMENT_CLASSES, bin_sentiment_scores
+except ImportError:  # run as a script from src/
+    from data_loader import SENTIMENT_CLASSES, bin_sentiment_scores
+
+# Display labels for the loader's sentiment_range bins, in bin order
+RANGE_LABELS = ['Extreme Fear (0-20)', 'Fear (20-40)', 'Neutral (40-60)',
+                'Greed (60-80)', 'Extreme Greed (80-100)']
+
+# Columns the analysis reads; the rest of the merged dataset is never loaded
+ANALYSIS_COLUMNS = ['date', 'net_pnl', 'is_win', 'is_long', 'is_short',
+                    'sentiment_class', 'sentiment_range', 'Size USD']
+
+# Rows parsed per chunk when converting a CSV input, bounding peak memory
+CSV_CHUNK_ROWS = 1_000_000
+
+# Explicit CSV column types, so every chunk matches the Parquet schema the first one sets
+CSV_COLUMN_DTYPES = {
+    'net_pnl': 'float64',
+    'Size USD': 'float64',
+    'sentiment_score': 'float32',
+    'is_win': 'bool',
+    'is_long': 'bool',
+    'is_short': 'bool',
+    'sentiment_class': 'str',
+}
+
+# Derived files (CSV conversions, pickled stats) live here, next to the dataset,
+# so they never overwrite the loader's own outputs
+CACHE_DIR = '.cache'
+# Bump whenever the cached tables change shape, so pickles from older code are ignored
+STATS_CACHE_VERSION = 3
+
+# P&L percentiles reported by pnl_distribution_analysis, and their _stats columns
+PNL_QUANTILES = np.array([0.25, 0.5, 0.75, 0.9, 0.95])
+PNL_QUANTILE_COLUMNS = ['PnL_25th', 'Median_PnL', 'PnL_75th', 'PnL_90th', 'PnL_95th']
+
+
+@njit(cache=True)
+def _group_distribution(codes, values, n_groups, qs):
+    """Count, mean, std, min, max and linear-interpolated quantiles per group,
+    selecting the quantile ranks with np.partition instead of sorting; NaN values are skipped"""
+    counts = np.zeros(n_groups, np.int64)
+    for i in range(codes.size):
+        c = codes[i]
+        if c >= 0 and not np.isnan(values[i]):
+            counts[c] += 1
+    
+    # Counting-sort the values into contiguous per-group buckets in O(N)
+    offsets = np.zeros(n_groups + 1, np.int64)
+    offsets[1:] = np.cumsum(counts)
+    fill = offsets[:-1].copy()
+    bucketed = np.empty(offsets[-1], values.dtype)
+    for i in range(codes.size):
+        c = codes[i]
+        if c >= 0 and not np.isnan(values[i]):
+            bucketed[fill[c]] = values[i]
+            fill[c] += 1
+    
+    stats = np.full((n_groups, 5), np.nan)  # mean, std, min, max, count
+    quantiles = np.full((n_groups, qs.size), np.nan)
+    for g in range(n_groups):
+        n = counts[g]
+        stats[g, 4] = n
+        if n == 0:
+            continue
+        seg = bucketed[offsets[g]:offsets[g + 1]]
+        mean = seg.mean()
+        stats[g, 0] = mean
+        stats[g, 1] = np.sqrt(((seg - mean) ** 2).sum() / (n - 1)) if n > 1 else np.nan
+        stats[g, 2] = seg.min()
+        stats[g, 3] = seg.max()
+        
+        # Only the ranks bracketing each quantile need to be in sorted position
+        ranks = np.empty(2 * qs.size, np.int64)
+        for j in range(qs.size):
+            lo = int(np.floor(qs[j] * (n - 1)))
+            ranks[2 * j] = lo
+            ranks[2 * j + 1] = min(lo + 1, n - 1)
+        part = np.partition(seg, np.unique(ranks))
+        for j in range(qs.size):
+            pos = qs[j] * (n - 1)
+            lo = ranks[2 * j]
+            hi = ranks[2 * j + 1]
+            quantiles[g, j] = part[lo] + (part[hi] - part[lo]) * (pos - lo)
+    return stats, quantiles
+
+
+@njit(parallel=True, cache=True)
+def _group_totals(codes, is_win, is_long, is_short, pnl, size, n_groups, n_chunks):
+    """Per-group trade, win, direction, P&L and size totals in one parallel pass"""
+    n = codes.size
+    chunk = (n + n_chunks - 1) // n_chunks
+    
+    # Per-chunk accumulators, reduced after the parallel loop
+    # columns: trades, wins, longs, shorts, pnl sum, pnl count, size sum, size count
+    acc = np.zeros((n_chunks, n_groups, 8))
+    for t in prange(n_chunks):
+        for i in range(t * chunk, min(n, (t + 1) * chunk)):
+            c = codes[i]
+            if c < 0:
+                continue
+            acc[t, c, 0] += 1
+            acc[t, c, 1] += is_win[i]
+            acc[t, c, 2] += is_long[i]
+            acc[t, c, 3] += is_short[i]
+            if not np.isnan(pnl[i]):
+                acc[t, c, 4] += pnl[i]
+                acc[t, c, 5] += 1
+            if not np.isnan(size[i]):
+                acc[t, c, 6] += size[i]
+                acc[t, c, 7] += 1
+    return acc.sum(axis=0)
+
+
+def format_table(df, decimals):
+    """Render a stats table with every float column fixed to `decimals` places"""
+    # The leading space keeps the column gap pandas' default float repr leaves for a sign
+    return df.to_string(float_format=f' {{:.{decimals}f}}'.format)
+
+
 class TraderAnalyzer:
-    def __init__(self, data_path='datasets/merged_btc_sentiment.csv'):
+    def __init__(self, data_path='datasets/merged_btc_sentiment.parquet'):
         self.data_path = Path(data_path)
         self.df = None
-        
+        self._stats = None
+        self._range_stats = None
+        self._freq_stats = None
+        self._n_rows = None
+        
+    def _ensure_parquet(self):
+        """Return the Parquet dataset path, converting a CSV export once"""
+        if self.data_path.suffix != '.csv':
+            return self.data_path
+        
+        # Not the CSV's sibling: merged_btc_sentiment.parquet is the loader's full dataset
+        parquet_path = self.data_path.parent / CACHE_DIR / f"{self.data_path.stem}.parquet"
+        if not parquet_path.exists() or parquet_path.stat().st_mtime < self.data_path.stat().st_mtime:
+            print(f"Converting {self.data_path} to Parquet...")
+            # sentiment_score is only read to derive sentiment_range
+            csv_columns = [c for c in ANALYSIS_COLUMNS if c != 'sentiment_range'] + ['sentiment_score']
+            # Chunks go to a temp file that only replaces the target once complete,
+            # so an interrupted conversion never leaves a truncated dataset behind
+            tmp_path = parquet_path.with_suffix('.parquet.tmp')
+            parquet_path.parent.mkdir(exist_ok=True)
+            writer = None
+            try:
+                # Stream the CSV so only one chunk is ever held in memory
+                for chunk in pd.read_csv(self.data_path, usecols=csv_columns, dtype=CSV_COLUMN_DTYPES,
+                                         chunksize=CSV_CHUNK_ROWS):
+                    # Pin the resolution too, which pd.to_datetime would otherwise infer per chunk
+                    chunk['date'] = pd.to_datetime(chunk['date']).astype('datetime64[ms]')
+                    chunk['sentiment_class'] = pd.Categorical(chunk['sentiment_class'],
+                                                              categories=SENTIMENT_CLASSES, ordered=True)
+                    chunk['sentiment_range'] = bin_sentiment_scores(chunk['sentiment_score'])
+                    
+                    # The first chunk fixes the schema; later chunks are cast to it
+                    schema = writer.schema if writer else None
+                    table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(tmp_path, table.schema, compression='zstd')
+                    writer.write_table(table)
+                writer.close()
+                writer = None
+                tmp_path.replace(parquet_path)
+            except BaseException:
+                if writer is not None:
+                    writer.close()
+                tmp_path.unlink(missing_ok=True)
+                raise
+        return parquet_path
+    
     def load_data(self):
         """Load merged dataset"""
         print("Loading merged dataset...")
-        self.df = pd.read_csv(self.data_path)
-        self.df['date'] = pd.to_datetime(self.df['date'])
+        self._stats = self._range_stats = self._freq_stats = None
+        self._load_rows()
+        # Reuse the aggregates too when they are cached for this dataset version
+        self._load_cached_stats()
         print(f"Loaded {len(self.df):,} transactions")
         return self.df
     
+    def _load_rows(self):
+        """Read the analysed columns and convert the kernel inputs"""
+        self.df = pd.read_parquet(self._ensure_parquet(), columns=ANALYSIS_COLUMNS)
+        
+        # Group on integer category codes rather than hashing class strings
+        if not isinstance(self.df['sentiment_class'].dtype, pd.CategoricalDtype):
+            self.df['sentiment_class'] = pd.Categorical(self.df['sentiment_class'],
+                                                        categories=SENTIMENT_CLASSES, ordered=True)
+        
+        # The loader already binned sentiment_score; relabel the bins instead of re-cutting every row
+        self.df['sentiment_range'] = self.df['sentiment_range'].cat.rename_categories(RANGE_LABELS)
+        
+        # Kernel inputs, converted once here rather than in every analysis method
+        self._classes = self.df['sentiment_class'].cat.categories
+        self._class_codes = self.df['sentiment_class'].cat.codes.to_numpy()
+        self._ranges = self.df['sentiment_range'].cat.categories
+        self._range_codes = self.df['sentiment_range'].cat.codes.to_numpy()
+        self._is_win = self.df['is_win'].to_numpy(np.int8)
+        self._is_long = self.df['is_long'].to_numpy(np.int8)
+        self._is_short = self.df['is_short'].to_numpy(np.int8)
+        self._pnl = self.df['net_pnl'].to_numpy(np.float64)
+        self._size = self.df['Size USD'].to_numpy(np.float64)
+        return self.df
+    
+    def _stats_cache_path(self):
+        """Pickle path for the aggregates of the current dataset and cache version"""
+        # Key on the Parquet file the stats are computed from; for a CSV input that is the
+        # converted copy, which is rebuilt (and so re-stamped) whenever the CSV changes
+        mtime = self._ensure_parquet().stat().st_mtime_ns
+        name = f"{self.data_path.stem}_stats_v{STATS_CACHE_VERSION}_{mtime}.pkl"
+        return self.data_path.parent / CACHE_DIR / name
+    
+    def _load_cached_stats(self):
+        """Restore the aggregates from the cache; False if there is no usable cache"""
+        try:
+            cache_path = self._stats_cache_path()
+            if not cache_path.exists():
+                return False
+            cached = pd.read_pickle(cache_path)
+            if cached.get('version') != STATS_CACHE_VERSION:
+                return False
+            stats, range_stats = cached['stats'], cached['range_stats']
+            freq_stats, n_rows = cached['freq_stats'], cached['n_rows']
+        except Exception:
+            # Unreadable or foreign pickle: the cache is only an optimisation, so recompute
+            return False
+        self._stats, self._range_stats = stats, range_stats
+        self._freq_stats, self._n_rows = freq_stats, n_rows
+        return True
+    
+    def _save_cached_stats(self):
+        """Pickle the aggregates, dropping caches of older dataset or cache versions"""
+        try:
+            cache_path = self._stats_cache_path()
+            cache_path.parent.mkdir(exist_ok=True)
+            for stale in cache_path.parent.glob(f"{self.data_path.stem}_stats_*.pkl"):
+                stale.unlink()
+            pd.to_pickle({
+                'version': STATS_CACHE_VERSION,
+                'stats': self._stats,
+                'range_stats': self._range_stats,
+                'freq_stats': self._freq_stats,
+                'n_rows': self._n_rows
+            }, cache_path)
+        except OSError:
+            pass  # read-only data directory: run uncached
+    
+    def _group_stats(self, codes, categories, key, total_name):
+        """Win, direction, P&L and size totals per category of `key`"""
+        totals = _group_totals(codes, self._is_win, self._is_long, self._is_short,
+                               self._pnl, self._size, len(categories), numba.get_num_threads())
+        
+        observed = totals[:, 0] > 0
+        totals = totals[observed]
+        counts = totals[:, 0].astype(np.int64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.DataFrame({
+                'Wins': totals[:, 1].astype(np.int64),
+                total_name: counts,
+                'Win_Rate': totals[:, 1] / counts,
+                'Total_PnL': totals[:, 4],
+                'Avg_PnL': totals[:, 4] / totals[:, 5],
+                'Avg_Size': totals[:, 6] / totals[:, 7],
+                'Longs': totals[:, 2].astype(np.int64),
+                'Shorts': totals[:, 3].astype(np.int64)
+            }, index=categories[observed].rename(key))
+    
+    def _compute_all_stats(self):
+        """Compute every per-sentiment aggregate in one pass per key"""
+        if self.df is None:
+            self._load_rows()
+        
+        totals = self._group_stats(self._class_codes, self._classes, 'sentiment_class', 'Total_Trades')
+        
+        # P&L percentiles and size spread come from the selection kernel rather than a pandas groupby
+        n_classes = len(self._classes)
+        pnl, pnl_quantiles = _group_distribution(self._class_codes, self._pnl, n_classes, PNL_QUANTILES)
+        size, size_median = _group_distribution(self._class_codes, self._size, n_classes, np.array([0.5]))
+        # One row per class; joining onto the totals keeps the classes that traded
+        spread = pd.DataFrame({
+            'PnL_Count': pnl[:, 4].astype(np.int64),
+            'PnL_Std': pnl[:, 1],
+            'PnL_Min': pnl[:, 2],
+            'PnL_Max': pnl[:, 3],
+            **dict(zip(PNL_QUANTILE_COLUMNS, pnl_quantiles.T)),
+            'Median_Size': size_median[:, 0],
+            'Std_Size': size[:, 1],
+            'Min_Size': size[:, 2],
+            'Max_Size': size[:, 3]
+        }, index=self._classes.rename('sentiment_class'))
+        self._stats = totals.join(spread)
+        self._range_stats = self._group_stats(self._range_codes, self._ranges, 'sentiment_range', 'Total')
+        self._freq_stats = self._daily_trade_stats()
+        self._n_rows = len(self.df)
+        self._save_cached_stats()
+        return self._stats
+    
     def win_rate_by_sentiment(self):
         """Calculate win rate for each sentiment category"""
         print("\n" + "=" * 60)
         print("WIN RATE BY SENTIMENT")
         print("=" * 60)
         
-        # Group by sentiment class
-        sentiment_groups = self.df.groupby('sentiment_class').agg({
-            'is_win': ['sum', 'count', 'mean'],
-            'net_pnl': ['sum', 'mean', 'median']
-        }).round(4)
+        if self._stats is None:
+            self._compute_all_stats()
         
-        sentiment_groups.columns = ['Wins', 'Total_Trades', 'Win_Rate', 
-                                    'Total_PnL', 'Avg_PnL', 'Median_PnL']
+        # Group by sentiment class
+        sentiment_groups = self._stats[['Wins', 'Total_Trades', 'Win_Rate',
+                                        'Total_PnL', 'Avg_PnL', 'Median_PnL']]
         
-        print(sentiment_groups)
+        print(format_table(sentiment_groups, 4))
         
         # Detailed breakdown by sentiment score ranges
         print("\n" + "-" * 60)
         print("WIN RATE BY SENTIMENT SCORE RANGES")
         print("-" * 60)
         
-        bins = [0, 20, 40, 60, 80, 100]
-        labels = ['Extreme Fear (0-20)', 'Fear (20-40)', 'Neutral (40-60)', 
-                  'Greed (60-80)', 'Extreme Greed (80-100)']
-        
-        self.df['sentiment_range'] = pd.cut(self.df['sentiment_score'], 
-                                             bins=bins, labels=labels, include_lowest=True)
-        
-        range_analysis = self.df.groupby('sentiment_range').agg({
-            'is_win': ['sum', 'count', 'mean'],
-            'net_pnl': ['sum', 'mean']
-        }).round(4)
-        
-        range_analysis.columns = ['Wins', 'Total', 'Win_Rate', 'Total_PnL', 'Avg_PnL']
-        print(range_analysis)
+        range_analysis = self._range_stats[['Wins', 'Total', 'Win_Rate', 'Total_PnL', 'Avg_PnL']]
+        print(format_table(range_analysis, 4))
         
         return sentiment_groups
     
@@ -65,12 +343,11 @@ class TraderAnalyzer:
         print("POSITION SIZING BY SENTIMENT")
         print("=" * 60)
         
-        sizing = self.df.groupby('sentiment_class').agg({
-            'Size USD': ['mean', 'median', 'std', 'min', 'max']
-        }).round(2)
+        if self._stats is None:
+            self._compute_all_stats()
         
-        sizing.columns = ['Avg_Size', 'Median_Size', 'Std_Size', 'Min_Size', 'Max_Size']
-        print(sizing)
+        sizing = self._stats[['Avg_Size', 'Median_Size', 'Std_Size', 'Min_Size', 'Max_Size']]
+        print(format_table(sizing, 2))
         
         return sizing
     
@@ -80,34 +357,63 @@ class TraderAnalyzer:
         print("TRADE DIRECTION BY SENTIMENT")
         print("=" * 60)
         
-        direction = self.df.groupby('sentiment_class').agg({
-            'is_long': 'sum',
-            'is_short': 'sum'
-        })
+        if self._stats is None:
+            self._compute_all_stats()
+        
+        # Direction counts come out of the same parallel scan as the win/P&L totals
+        longs = self._stats['Longs'].to_numpy()
+        shorts = self._stats['Shorts'].to_numpy()
+        total = longs + shorts
+        long_ratio = np.divide(longs * 100.0, total, out=np.full(len(total), np.nan), where=total > 0)
         
-        direction['Total'] = direction['is_long'] + direction['is_short']
-        direction['Long_Ratio'] = (direction['is_long'] / direction['Total'] * 100).round(2)
-        direction['Short_Ratio'] = (direction['is_short'] / direction['Total'] * 100).round(2)
+        direction = pd.DataFrame({
+            'is_long': longs,
+            'is_short': shorts,
+            'Total': total,
+            'Long_Ratio': long_ratio,
+            'Short_Ratio': 100.0 - long_ratio
+        }, index=self._stats.index)
         
-        print(direction)
+        print(format_table(direction, 2))
         
         return direction
     
+    def _daily_trade_stats(self):
+        """Summary of trades per trading day for each sentiment class"""
+        # Trades per day by sentiment: a (date x class) count matrix from packed integer keys
+        date_codes, dates = pd.factorize(self.df['date'])
+        class_codes = self._class_codes
+        n_classes = len(self._classes)
+        valid = (date_codes >= 0) & (class_codes >= 0)
+        counts = np.bincount(date_codes[valid] * n_classes + class_codes[valid],
+                             minlength=len(dates) * n_classes).reshape(len(dates), n_classes)
+        
+        # Only days on which a class actually traded count towards its statistics
+        observed = (counts > 0).any(axis=0)
+        daily_trades = np.where(counts > 0, counts, np.nan)[:, observed]
+        
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # single-day classes have no std
+            freq_stats = pd.DataFrame({
+                'Avg_Daily_Trades': np.nanmean(daily_trades, axis=0),
+                'Median': np.nanmedian(daily_trades, axis=0),
+                'Std': np.nanstd(daily_trades, axis=0, ddof=1),
+                'Min': np.nanmin(daily_trades, axis=0).astype(np.int64),
+                'Max': np.nanmax(daily_trades, axis=0).astype(np.int64)
+            }, index=self._classes[observed].rename('sentiment_class'))
+        return freq_stats
+    
     def trade_frequency_analysis(self):
         """Analyze trading frequency across sentiment phases"""
         print("\n" + "=" * 60)
         print("TRADE FREQUENCY BY SENTIMENT")
         print("=" * 60)
         
-        # Trades per day by sentiment
-        daily_trades = self.df.groupby(['date', 'sentiment_class']).size().reset_index(name='trade_count')
+        if self._stats is None:
+            self._compute_all_stats()
         
-        freq_stats = daily_trades.groupby('sentiment_class')['trade_count'].agg([
-            'mean', 'median', 'std', 'min', 'max'
-        ]).round(2)
-        
-        freq_stats.columns = ['Avg_Daily_Trades', 'Median', 'Std', 'Min', 'Max']
-        print(freq_stats)
+        freq_stats = self._freq_stats
+        print(format_table(freq_stats, 2))
         
         return freq_stats
     
@@ -117,17 +423,24 @@ class TraderAnalyzer:
         print("P&L DISTRIBUTION BY SENTIMENT")
         print("=" * 60)
         
-        pnl_stats = self.df.groupby('sentiment_class')['net_pnl'].describe().round(2)
-        print(pnl_stats)
+        if self._stats is None:
+            self._compute_all_stats()
+        
+        # The mean is shared with the win-rate totals; the rest comes from the fused spread pass,
+        # whose count (like describe()) covers only trades with a recorded P&L
+        pnl_stats = self._stats[['PnL_Count', 'Avg_PnL', 'PnL_Std', 'PnL_Min',
+                                 'PnL_25th', 'Median_PnL', 'PnL_75th', 'PnL_Max']]
+        pnl_stats.columns = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+        print(format_table(pnl_stats, 2))
         
         # Calculate percentiles
         print("\n" + "-" * 60)
         print("P&L PERCENTILES BY SENTIMENT")
         print("-" * 60)
         
-        percentiles = self.df.groupby('sentiment_class')['net_pnl'].quantile([0.25, 0.5, 0.75, 0.9, 0.95]).unstack()
+        percentiles = self._stats[PNL_QUANTILE_COLUMNS]
         percentiles.columns = ['25th', '50th', '75th', '90th', '95th']
-        print(percentiles.round(2))
+        print(format_table(percentiles, 2))
         
         return pnl_stats
     
@@ -137,20 +450,18 @@ class TraderAnalyzer:
         print("OPTIMAL VS WORST TRADING CONDITIONS")
         print("=" * 60)
         
-        # Group by sentiment range
-        perf = self.df.groupby('sentiment_range').agg({
-            'net_pnl': ['sum', 'mean', 'count'],
-            'is_win': 'mean'
-        }).round(4)
+        if self._range_stats is None:
+            self._compute_all_stats()
         
-        perf.columns = ['Total_PnL', 'Avg_PnL', 'Trade_Count', 'Win_Rate']
-        perf = perf.sort_values('Win_Rate', ascending=False)
+        # Group by sentiment range
+        perf = self._range_stats[['Total_PnL', 'Avg_PnL', 'Total', 'Win_Rate']]
+        perf = perf.rename(columns={'Total': 'Trade_Count'}).sort_values('Win_Rate', ascending=False)
         
         print("\n📈 BEST CONDITIONS (Ranked by Win Rate):")
-        print(perf.head(3))
+        print(format_table(perf.head(3), 4))
         
         print("\n📉 WORST CONDITIONS (Ranked by Win Rate):")
-        print(perf.tail(3))
+        print(format_table(perf.tail(3), 4))
         
         return perf
     
@@ -160,7 +471,12 @@ class TraderAnalyzer:
         print("BITCOIN SENTIMENT TRADER ANALYSIS")
         print("=" * 60)
         
-        self.load_data()
+        # Every report below is served from the aggregates, so when they are cached
+        # for the current dataset the rows never need to be read
+        if self._load_cached_stats():
+            print(f"Loaded cached statistics for {self._n_rows:,} transactions")
+        else:
+            self.load_data()
         
         self.win_rate_by_sentiment()
         self.position_sizing_analysis()